@@ -1,26 +1,171 @@
-from flask import Flask, render_template, request, url_for, redirect, session, flash, jsonify
+from flask import Flask, render_template, request, url_for, redirect, session, flash, jsonify, has_request_context, g, \
+    abort, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from werkzeug.security import generate_password_hash, check_password_hash
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, event, text, Insert, Update, Delete
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from collections import Counter
+from concurrent.futures import Future
+import atexit
+import hmac
+import itertools
+import json
+import queue
+import re
+import sys
+import uuid
+import threading
+import time
 import random
 import string
 import os
 from dotenv import load_dotenv
 import logging
+import logging.handlers
 
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+LOG_CONFIG = {
+    'enabled': os.getenv('LOGGING_ENABLED', 'true').lower() == 'true',
+    'level': os.getenv('LOG_LEVEL', 'INFO').upper(),
+    'format': os.getenv('LOG_FORMAT', 'json'),  # or 'text'
+    'info_sample_rate': float(os.getenv('LOG_INFO_SAMPLE_RATE', '1.0'))  # fraction of INFO/DEBUG kept
+}
+
+EMAIL_PATTERN = re.compile(r'([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+\.[A-Za-z]{2,})')
+OTP_PATTERN = re.compile(r'(\botp\W{0,3})\d{4,8}\b', re.IGNORECASE)
+
+
+def redact(message):
+    """Mask email addresses (keeping first letter and domain) and the codes that follow an "OTP" label"""
+    message = EMAIL_PATTERN.sub(r'\1***@\2', message)
+    return OTP_PATTERN.sub(r'\1******', message)
+
+
+class RequestContextFilter(logging.Filter):
+    """Tag records with the request's correlation id and sample low-severity records.
+
+    Runs on the request thread, so it must stay cheap - formatting happens on the
+    listener thread.
+    """
+
+    def __init__(self, info_sample_rate=1.0):
+        super().__init__()
+        self.info_sample_rate = info_sample_rate
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and self.info_sample_rate < 1.0 \
+                and random.random() >= self.info_sample_rate:
+            return False
+        record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with emails and OTPs redacted"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': redact(record.getMessage())
+        }
+        if record.exc_info:
+            entry['exception'] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread.
+
+    The stock prepare() formats every record on the calling thread; we only log
+    immutable values (strings, ids, exceptions), so passing the record through
+    untouched is safe in-process.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging():
+    """Route all logging through a queue so handler I/O happens off the request thread"""
+    root = logging.getLogger()
+    if not LOG_CONFIG['enabled']:
+        logging.disable(logging.CRITICAL)
+        return None
+
+    if LOG_CONFIG['format'] == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = RedactingFormatter('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s')
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter(LOG_CONFIG['info_sample_rate']))
+
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_CONFIG['level'])
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def restart_log_listener():
+    """Give a forked child (e.g. gunicorn --preload workers) its own queue and listener thread"""
+    global log_listener
+    if log_listener is None:
+        return
+    log_listener = logging.handlers.QueueListener(
+        queue.SimpleQueue(), *log_listener.handlers, respect_handler_level=True
+    )
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DeferredQueueHandler):
+            handler.queue = log_listener.queue
+    log_listener.start()
+
+
+def stop_log_listener():
+    if log_listener is not None:
+        log_listener.stop()
+
+
+log_listener = setup_logging()
+atexit.register(stop_log_listener)
+os.register_at_fork(after_in_child=restart_log_listener)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+
+@app.before_request
+def assign_request_id():
+    g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+
+
+@app.after_request
+def add_request_id_header(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
 # ===== CONFIGURATION =====
 app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 
@@ -29,7 +174,11 @@ app.config['SESSION_PERMANENT'] = False
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)
 
 # Database configuration
+# Set SQLITE_PATH (and leave DATABASE_URL unset) to run in embedded single-node mode
 DATABASE_URL = os.getenv('DATABASE_URL')
+SQLITE_PATH = os.getenv('SQLITE_PATH')
+if not DATABASE_URL and SQLITE_PATH:
+    DATABASE_URL = f"sqlite:///{os.path.abspath(SQLITE_PATH)}"
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
@@ -37,20 +186,169 @@ if not DATABASE_URL:
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = os.getenv('SQLALCHEMY_ECHO', 'false').lower() == 'true'
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_pre_ping': True,
-    'pool_recycle': 300,
-    'pool_size': 5,
-    'max_overflow': 10,
-    'connect_args': {
-        'connect_timeout': 10
+if IS_SQLITE:
+    # Bounded pool; a connection is only ever used by the thread that checked it out
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': QueuePool,
+        'pool_size': int(os.getenv('SQLITE_POOL_SIZE', '8')),
+        'max_overflow': int(os.getenv('SQLITE_MAX_OVERFLOW', '8')),
+        'connect_args': {
+            'timeout': 10,
+            'check_same_thread': False
+        }
+    }
+else:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_pre_ping': True,
+        'pool_recycle': 300,
+        'pool_size': 5,
+        'max_overflow': 10,
+        'connect_args': {
+            'connect_timeout': 10
+        }
     }
+
+# SQLite tuning for a single cafe box
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 10000,
+    'temp_store': 'MEMORY',
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-64000'))  # negative = KiB, so ~64 MB
+}
+
+# Optional read replicas (Postgres only) - comma-separated URLs
+REPLICA_CONFIG = {
+    'urls': [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()],
+    'strategy': os.getenv('REPLICA_STRATEGY', 'round_robin'),  # or 'latency'
+    'health_interval': float(os.getenv('REPLICA_HEALTH_INTERVAL', '10')),
+    'sticky_seconds': float(os.getenv('READ_YOUR_WRITES_SECONDS', '5'))
 }
 
-db = SQLAlchemy(app)
+
+class ReplicaRouter:
+    """Pick a healthy read replica, falling back to the primary (None) when there isn't one"""
+
+    def __init__(self, urls, strategy='round_robin', health_interval=10):
+        self.engines = []
+        for url in urls:
+            if url.startswith("postgres://"):
+                url = url.replace("postgres://", "postgresql://", 1)
+            engine = create_engine(url, **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+            event.listen(engine, 'handle_error', self._on_error)
+            self.engines.append(engine)
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self.healthy = {engine: True for engine in self.engines}
+        self.latency = {engine: 0.0 for engine in self.engines}
+        self._counter = itertools.count()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _on_error(self, context):
+        # Drop a replica as soon as it loses its connection; the health check brings it back
+        if context.is_disconnect and context.engine in self.healthy:
+            self.healthy[context.engine] = False
+            logger.warning("Replica %s disconnected, routing reads to primary", context.engine.url.host)
+
+    def check_health(self):
+        """Ping every replica, recording availability and an EWMA of round-trip latency"""
+        for engine in self.engines:
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                elapsed = time.perf_counter() - start
+                self.latency[engine] = elapsed if not self.latency[engine] else 0.8 * self.latency[engine] + 0.2 * elapsed
+                self.healthy[engine] = True
+            except Exception as e:
+                if self.healthy[engine]:
+                    logger.warning("Replica %s failed health check: %s", engine.url.host, e)
+                self.healthy[engine] = False
+
+    def _run_health_checks(self):
+        while True:
+            time.sleep(self.health_interval)
+            self.check_health()
+
+    def _ensure_started(self):
+        # Restart after fork (e.g. gunicorn workers) - threads don't survive it
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run_health_checks, name='replica-health', daemon=True)
+                self._thread.start()
+
+    def choose(self):
+        if not self.engines:
+            return None
+        self._ensure_started()
+
+        candidates = [engine for engine in self.engines if self.healthy[engine]]
+        if not candidates:
+            return None
+        if self.strategy == 'latency':
+            return min(candidates, key=lambda engine: self.latency[engine])
+        return candidates[next(self._counter) % len(candidates)]
+
+
+class RoutingSession(FlaskSession):
+    """Send reads to a replica and writes (plus everything after them) to the primary.
+
+    Once a session has written, it stays on the primary until it is removed at the
+    end of the request. After a commit, the user's reads also stick to the primary
+    for READ_YOUR_WRITES_SECONDS so they see their own changes despite replica lag.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or replica_router is None:
+            return primary
+
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            self.info['pinned'] = True
+            self.info['wrote'] = True
+        if self.info.get('pinned') or is_user_pinned():
+            return primary
+
+        return replica_router.choose() or primary
+
+
+def is_user_pinned():
+    """True while the current user is inside their read-your-writes window"""
+    return has_request_context() and session.get('db_primary_until', 0) > time.time()
+
+
+def pin_to_primary():
+    """Route the rest of this request's queries to the primary (use before multi-step transactions)"""
+    db.session.info['pinned'] = True
+
+
+replica_router = None
+if REPLICA_CONFIG['urls'] and not IS_SQLITE:
+    replica_router = ReplicaRouter(
+        REPLICA_CONFIG['urls'],
+        strategy=REPLICA_CONFIG['strategy'],
+        health_interval=REPLICA_CONFIG['health_interval']
+    )
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def start_read_your_writes_window(db_session):
+    if replica_router is not None and db_session.info.pop('wrote', False) and has_request_context():
+        session['db_primary_until'] = time.time() + REPLICA_CONFIG['sticky_seconds']
 
 # Email configuration from environment variables
 EMAIL_CONFIG = {
@@ -65,6 +363,77 @@ if not EMAIL_CONFIG['sender_email'] or not EMAIL_CONFIG['sender_password']:
     logger.warning("Email credentials not configured. Email functionality will be disabled.")
 
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply SQLITE_PRAGMAS to every new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+class SQLiteWriteQueue:
+    """Run write transactions one at a time on a dedicated writer thread.
+
+    SQLite allows a single writer, so queueing inserts here avoids request
+    threads fighting over the database lock (and SQLITE_BUSY errors).
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Restart after fork (e.g. gunicorn workers) - threads don't survive it
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args), commit it, and block until it finishes. Returns fn's result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((fn, args, future))
+        return future.result()
+
+    def _run(self):
+        with app.app_context():
+            while True:
+                fn, args, future = self._queue.get()
+                try:
+                    result = fn(*args)
+                    db.session.commit()
+                    future.set_result(result)
+                except BaseException as e:
+                    db.session.rollback()
+                    future.set_exception(e)
+                finally:
+                    db.session.remove()
+
+
+sqlite_writer = SQLiteWriteQueue()
+
+
+def run_write(fn, *args):
+    """Run and commit a write transaction - through the writer queue on SQLite.
+
+    fn should only touch db.session and return plain values (not ORM objects),
+    since on SQLite it runs in the writer thread's session.
+    """
+    if IS_SQLITE:
+        # End this thread's read transaction first: a request holding a pooled
+        # connection while it waits could leave the writer none to check out
+        db.session.commit()
+        return sqlite_writer.submit(fn, *args)
+    result = fn(*args)
+    db.session.commit()
+    return result
+
+
 # ===== DATABASE MODELS =====
 # Get Asia/Kolkata timezone
 def get_ist_time():
@@ -109,6 +478,7 @@ class Order(db.Model):
     order_date = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(20), default='Pending')
     created_at = db.Column(db.DateTime, default=get_ist_time)
+    completed_at = db.Column(db.DateTime, nullable=True, index=True)  # left the kitchen (Ready/Delivered)
 
     # Relationship
     order_items = db.relationship('OrderItem', backref='order', cascade='all, delete-orphan', lazy='dynamic')
@@ -124,6 +494,156 @@ class OrderItem(db.Model):
     created_at = db.Column(db.DateTime, default=get_ist_time)
 
 
+class KitchenState(db.Model):
+    """Single row (id=1) of kitchen counters shared by every worker"""
+    __tablename__ = 'kitchen_state'
+    id = db.Column(db.Integer, primary_key=True)
+    active_orders = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ===== KITCHEN SCHEDULING =====
+KITCHEN_CONFIG = {
+    'minutes_per_order': float(os.getenv('KITCHEN_MINUTES_PER_ORDER', '4')),  # prior until we have data
+    'prep_minutes': float(os.getenv('KITCHEN_PREP_MINUTES', '10')),
+    'delivery_minutes': float(os.getenv('KITCHEN_DELIVERY_MINUTES', '20')),
+    'max_wait_minutes': float(os.getenv('KITCHEN_MAX_WAIT_MINUTES', '90')),
+    'admission': os.getenv('KITCHEN_ADMISSION', 'off'),  # 'off' or 'throttle'
+    'resync_seconds': float(os.getenv('KITCHEN_RESYNC_SECONDS', '300')),  # service-time model rebuild
+    'history_size': int(os.getenv('KITCHEN_HISTORY_SIZE', '50'))  # recent completions used to seed the model
+}
+
+ACTIVE_ORDER_STATUSES = ('Pending', 'Preparing')
+ORDER_STATUSES = ACTIVE_ORDER_STATUSES + ('Ready', 'Delivered', 'Cancelled')
+
+
+class KitchenScheduler:
+    """Estimate delivery times from the current kitchen backlog.
+
+    The backlog is the shared KitchenState.active_orders counter, which
+    insert_order and set_order_status update in the same transaction as the
+    order. Every worker reads it with one primary-key lookup per order, so all
+    of them see every arrival. Throughput is an exponentially weighted
+    mean/variance of the gap between completions while the kitchen is busy.
+    Each worker refines it from the transitions it serves, and every
+    resync_seconds rebuilds it from the last history_size rows of
+    Order.created_at/completed_at. Between rebuilds, workers' service-time
+    estimates can differ slightly, but the backlog they use is always exact.
+    """
+
+    def __init__(self, minutes_per_order, alpha=0.2):
+        self.alpha = alpha
+        self.mean_seconds = minutes_per_order * 60
+        self.var_seconds = (self.mean_seconds / 2) ** 2
+        self.backlog = 0
+        # Last completion, or the arrival that ended an idle spell; None while idle
+        self.last_completion = None
+        self.last_sync = 0.0
+        self._lock = threading.Lock()
+
+    def _update_service_time(self, seconds):
+        # Incremental EW mean/variance (West 1979)
+        delta = seconds - self.mean_seconds
+        self.mean_seconds += self.alpha * delta
+        self.var_seconds = (1 - self.alpha) * (self.var_seconds + self.alpha * delta * delta)
+
+    def _service_times(self, rows):
+        """Yield per-order kitchen time from (created_at, completed_at) rows in completion order.
+
+        An order's work starts when the previous order finished, or when it
+        arrived if the kitchen was idle by then.
+        """
+        previous = None
+        for created_at, completed_at in rows:
+            if previous is not None and created_at is not None:
+                seconds = (completed_at - max(previous, created_at)).total_seconds()
+                if seconds > 0:
+                    yield seconds
+            previous = completed_at
+
+    def sync(self, force=False):
+        """Read the shared backlog, and rebuild the service-time model if it is stale"""
+        now = time.time()
+        try:
+            state = db.session.get(KitchenState, 1)
+        except SQLAlchemyError as e:
+            logger.error("Kitchen backlog sync failed: %s", e)
+            return
+        backlog = state.active_orders if state is not None else self.backlog
+
+        if force or now - self.last_sync >= KITCHEN_CONFIG['resync_seconds']:
+            self.last_sync = now
+            try:
+                rows = db.session.query(Order.created_at, Order.completed_at) \
+                    .filter(Order.completed_at.isnot(None)) \
+                    .order_by(Order.completed_at.desc()) \
+                    .limit(KITCHEN_CONFIG['history_size']).all()
+            except SQLAlchemyError as e:
+                logger.error("Kitchen history sync failed: %s", e)
+                rows = None
+
+            if rows is not None:
+                history = KitchenScheduler(KITCHEN_CONFIG['minutes_per_order'], self.alpha)
+                for seconds in self._service_times(reversed(rows)):
+                    history._update_service_time(seconds)
+                with self._lock:
+                    self.mean_seconds = history.mean_seconds
+                    self.var_seconds = history.var_seconds
+
+        with self._lock:
+            backlog = max(backlog, 0)
+            if backlog == 0:
+                self.last_completion = None
+            elif self.backlog == 0 and self.last_completion is None:
+                self.last_completion = now
+            self.backlog = backlog
+
+    def record_arrival(self):
+        with self._lock:
+            if self.backlog == 0:
+                self.last_completion = time.time()
+            self.backlog += 1
+
+    def record_status_change(self, old_status, new_status):
+        """Track an order leaving (or re-entering) the kitchen queue"""
+        was_active = old_status in ACTIVE_ORDER_STATUSES
+        is_active = new_status in ACTIVE_ORDER_STATUSES
+        if was_active == is_active:
+            return
+        if is_active:
+            # Ready/Delivered/Cancelled sent back to the kitchen counts as a new arrival
+            self.record_arrival()
+            return
+        now = time.time()
+        with self._lock:
+            self.backlog = max(self.backlog - 1, 0)
+            # last_completion is cleared whenever the queue empties, so the gap
+            # below never includes time the kitchen spent idle
+            if new_status != 'Cancelled':
+                if self.last_completion is not None:
+                    self._update_service_time(now - self.last_completion)
+                self.last_completion = now
+            if self.backlog == 0:
+                self.last_completion = None
+
+    def estimate(self):
+        """Return (low, high) delivery minutes for an order placed now"""
+        with self._lock:
+            queue_minutes = self.backlog * self.mean_seconds / 60
+            spread_minutes = (self.backlog ** 0.5) * (self.var_seconds ** 0.5) / 60
+        base = KITCHEN_CONFIG['prep_minutes'] + KITCHEN_CONFIG['delivery_minutes'] + queue_minutes
+        return round(max(base - spread_minutes, KITCHEN_CONFIG['prep_minutes'])), round(base + spread_minutes + 10)
+
+    def should_throttle(self, eta):
+        return KITCHEN_CONFIG['admission'] == 'throttle' and eta[0] > KITCHEN_CONFIG['max_wait_minutes']
+
+
+kitchen = KitchenScheduler(KITCHEN_CONFIG['minutes_per_order'])
+
+
+def format_eta(eta):
+    return f"{eta[0]}-{eta[1]} minutes"
+
+
 # ===== HELPER FUNCTIONS =====
 def check_and_create_tables():
     """Check if tables exist, create only if they don't - PRESERVES DATA"""
@@ -134,14 +654,14 @@ def check_and_create_tables():
             inspector = inspect(db.engine)
 
             existing_tables = inspector.get_table_names()
-            required_tables = ['signup', 'orders', 'order_items']
+            required_tables = ['signup', 'orders', 'order_items', 'kitchen_state']
 
             tables_to_create = [table for table in required_tables if table not in existing_tables]
 
             if tables_to_create:
-                print(f"Creating missing tables: {tables_to_create}")
+                logger.info("Creating missing tables: %s", tables_to_create)
                 db.create_all()
-                print("✅ Missing database tables created successfully!")
+                logger.info("Missing database tables created successfully")
 
                 # Create admin user only if signup table was just created
                 if 'signup' in tables_to_create:
@@ -153,21 +673,74 @@ def check_and_create_tables():
                         admin_user.password = "Admin@123"
                         db.session.add(admin_user)
                         db.session.commit()
-                        print("✅ Admin test user created!")
+                        logger.info("Admin test user created")
                     except:
                         db.session.rollback()
-                        print("ℹ️  Admin user already exists")
+                        logger.info("Admin user already exists")
+
+                # Seed the shared kitchen counter from any orders already in the queue
+                if 'kitchen_state' in tables_to_create:
+                    active_orders = Order.query.filter(Order.status.in_(ACTIVE_ORDER_STATUSES)).count()
+                    db.session.add(KitchenState(id=1, active_orders=active_orders))
+                    db.session.commit()
             else:
-                print("✅ All database tables already exist. Data preserved.")
+                logger.info("All database tables already exist. Data preserved.")
+
+            # Add columns introduced after the tables were first created
+            if 'orders' in existing_tables:
+                order_columns = [column['name'] for column in inspector.get_columns('orders')]
+                if 'completed_at' not in order_columns:
+                    with db.engine.begin() as conn:
+                        conn.execute(text("ALTER TABLE orders ADD COLUMN completed_at TIMESTAMP"))
+                        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_completed_at ON orders (completed_at)"))
+                    logger.info("Added orders.completed_at column")
 
         except Exception as e:
-            print(f"❌ Database check error: {e}")
+            logger.error("Database check error: %s", e)
             # Try to create tables anyway as fallback
             try:
                 db.create_all()
-                print("✅ Database tables created as fallback!")
+                logger.info("Database tables created as fallback")
             except Exception as e2:
-                print(f"❌ Fallback also failed: {e2}")
+                logger.error("Fallback also failed: %s", e2)
+
+
+def adjust_active_orders(delta):
+    """Shift the shared active-order count inside the caller's write transaction"""
+    KitchenState.query.filter_by(id=1).update(
+        {'active_orders': KitchenState.active_orders + delta}, synchronize_session=False
+    )
+
+
+def insert_order(user_id, username, email, total_amount, address, cart_items):
+    """Insert an order and its items, returning the new order id"""
+    new_order = Order(
+        user_id=user_id,
+        username=username,
+        email=email,
+        total_amount=total_amount,
+        delivery_address=address,
+        order_date=get_ist_time(),
+        status='Pending'
+    )
+    db.session.add(new_order)
+    db.session.flush()
+
+    # Insert order items
+    for item in cart_items:
+        if 'name' not in item or 'quantity' not in item or 'price' not in item:
+            continue
+
+        new_item = OrderItem(
+            order_id=new_order.id,
+            item_name=item['name'],
+            quantity=item['quantity'],
+            price=item['price']
+        )
+        db.session.add(new_item)
+
+    adjust_active_orders(1)
+    return new_order.id
 
 
 def generate_otp(length=6):
@@ -243,14 +816,14 @@ def send_otp_email(email, otp):
             server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
             server.send_message(msg)
 
-        logger.info(f"OTP sent to {email}")
+        logger.info("OTP sent to %s", email)
         return True
     except Exception as e:
-        logger.error(f"OTP Email sending error: {e}")
+        logger.error("OTP Email sending error: %s", e)
         return False
 
 
-def send_order_confirmation_email(customer_email, customer_name, order_details, total_amount, address):
+def send_order_confirmation_email(customer_email, customer_name, order_details, total_amount, address, eta_text="30-40 minutes"):
     """Send order confirmation email"""
     if not EMAIL_CONFIG['sender_email'] or not EMAIL_CONFIG['sender_password']:
         logger.error("Email credentials not configured")
@@ -303,7 +876,7 @@ def send_order_confirmation_email(customer_email, customer_name, order_details,
                 </div>
 
                 <p style="margin-top: 20px;">
-                  <strong>Estimated Delivery Time:</strong> 30-40 minutes
+                  <strong>Estimated Delivery Time:</strong> {eta_text}
                 </p>
 
                 <p>If you have any questions, please contact us at:</p>
@@ -326,10 +899,10 @@ def send_order_confirmation_email(customer_email, customer_name, order_details,
             server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
             server.send_message(msg)
 
-        logger.info(f"Order confirmation sent to {customer_email}")
+        logger.info("Order confirmation sent to %s", customer_email)
         return True
     except Exception as e:
-        logger.error(f"Order confirmation email error: {e}")
+        logger.error("Order confirmation email error: %s", e)
         return False
 
 
@@ -362,10 +935,12 @@ def login():
                 session['email'] = user.email
                 session['user_id'] = user.id
 
-                # Update last login time with IST
-                user.last_login = get_ist_time()
+                # Update last login time with IST - a direct UPDATE goes to the primary
+                # without needing the row above to have been read from it
+                Signup.query.filter_by(id=user.id).update({'last_login': get_ist_time()})
                 db.session.commit()
 
+                logger.info("User %s logged in", user.username)
                 flash('Login successful!', 'success')
                 return redirect(url_for('home'))
             else:
@@ -415,25 +990,25 @@ def forgot_password():
                     
                     if send_otp_email(user.email, otp):
                         flash('OTP sent to your registered email successfully!', 'success')
-                        logger.info(f"OTP sent to {user.email} for password reset - Username: {username}")
+                        logger.info("OTP sent to %s for password reset - Username: %s", user.email, username)
                         return redirect(url_for('verify_otp'))
                     else:
                         flash('Failed to send OTP. Please try again.', 'error')
-                        logger.error(f"Failed to send OTP to {user.email}")
+                        logger.error("Failed to send OTP to %s", user.email)
                 else:
                     # Username exists but email doesn't match
                     flash('The email address does not match with the registered email for this username!', 'error')
-                    logger.warning(f"Password reset attempt with mismatched email for username: {username}")
+                    logger.warning("Password reset attempt with mismatched email for username: %s", username)
             else:
                 # Username not found
                 flash('No account found with this username!', 'error')
-                logger.warning(f"Password reset attempt with non-existent username: {username}")
+                logger.warning("Password reset attempt with non-existent username: %s", username)
                 
         except SQLAlchemyError as e:
-            logger.error(f"Database error in forgot password: {e}")
+            logger.error("Database error in forgot password: %s", e)
             flash('An error occurred. Please try again.', 'error')
         except Exception as e:
-            logger.error(f"Unexpected error in forgot password: {e}")
+            logger.error("Unexpected error in forgot password: %s", e)
             flash('An unexpected error occurred.', 'error')
     
     return render_template("forgot_password.html")
@@ -497,6 +1072,7 @@ def reset_password():
             return render_template("reset_password.html")
 
         try:
+            pin_to_primary()
             user = Signup.query.filter_by(email=session['reset_email']).first()
 
             if user:
@@ -514,10 +1090,10 @@ def reset_password():
 
         except SQLAlchemyError as e:
             db.session.rollback()
-            logger.error(f"Database error resetting password: {e}")
+            logger.error("Database error resetting password: %s", e)
             flash('An error occurred. Please try again.', 'error')
         except Exception as e:
-            logger.error(f"Unexpected error resetting password: {e}")
+            logger.error("Unexpected error resetting password: %s", e)
             flash('An unexpected error occurred.', 'error')
 
     return render_template("reset_password.html")
@@ -561,7 +1137,7 @@ def signup():
 
         except Exception as e:
             db.session.rollback()
-            logger.error(f'Database error: {e}')
+            logger.error("Database error: %s", e)
             flash('Error occurred. Please try again.', 'error')
             return render_template("signup.html")
 
@@ -607,34 +1183,28 @@ def place_order():
         if total_amount <= 0:
             return jsonify({'success': False, 'message': 'Invalid total amount'}), 400
 
+        kitchen.sync()
+        eta = kitchen.estimate()
+        if kitchen.should_throttle(eta):
+            return jsonify({
+                'success': False,
+                'message': f'Our kitchen is very busy right now (about {format_eta(eta)}). Please try again shortly.',
+                'eta_minutes': eta
+            }), 429
+
         try:
-            # Create new order
-            new_order = Order(
-                user_id=session['user_id'],
-                username=session['username'],
-                email=session['email'],
-                total_amount=total_amount,
-                delivery_address=address,
-                order_date=get_ist_time(),
-                status='Pending'
+            # Create new order (serialized through the writer queue on SQLite)
+            order_id = run_write(
+                insert_order,
+                session['user_id'],
+                session['username'],
+                session['email'],
+                total_amount,
+                address,
+                cart_items
             )
-            db.session.add(new_order)
-            db.session.flush()
-
-            # Insert order items
-            for item in cart_items:
-                if 'name' not in item or 'quantity' not in item or 'price' not in item:
-                    continue
-
-                new_item = OrderItem(
-                    order_id=new_order.id,
-                    item_name=item['name'],
-                    quantity=item['quantity'],
-                    price=item['price']
-                )
-                db.session.add(new_item)
-
-            db.session.commit()
+            kitchen.record_arrival()
+            logger.info("Order %s placed by %s (ETA %s)", order_id, session['username'], format_eta(eta))
 
             # Prepare order details for email
             order_details_html = ""
@@ -656,30 +1226,82 @@ def place_order():
                     session['username'],
                     order_details_html,
                     total_amount,
-                    address
+                    address,
+                    format_eta(eta)
                 )
 
             return jsonify({
                 'success': True,
                 'message': 'Order placed successfully!' +
                            (' Email confirmation sent.' if email_sent else ' (Email notification failed)'),
-                'order_id': new_order.id
+                'order_id': order_id,
+                'eta_minutes': eta,
+                'eta_text': format_eta(eta)
             })
 
         except SQLAlchemyError as e:
             db.session.rollback()
-            logger.error(f"Database error placing order: {e}")
+            logger.error("Database error placing order: %s", e)
             return jsonify({'success': False, 'message': 'Failed to save order. Please try again.'}), 500
         except Exception as e:
             db.session.rollback()
-            logger.error(f"Unexpected error placing order: {e}")
+            logger.error("Unexpected error placing order: %s", e)
             return jsonify({'success': False, 'message': 'An unexpected error occurred.'}), 500
 
     except Exception as e:
-        logger.error(f"Error processing order request: {e}")
+        logger.error("Error processing order request: %s", e)
         return jsonify({'success': False, 'message': 'Invalid request format'}), 400
 
 
+def set_order_status(order_id, status):
+    """Update an order's status, returning the previous one (None if not found)"""
+    pin_to_primary()
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return None
+    old_status = order.status
+    order.status = status
+    if status in ACTIVE_ORDER_STATUSES or status == 'Cancelled':
+        order.completed_at = None
+    elif old_status in ACTIVE_ORDER_STATUSES:
+        order.completed_at = get_ist_time()
+
+    was_active = old_status in ACTIVE_ORDER_STATUSES
+    is_active = status in ACTIVE_ORDER_STATUSES
+    if was_active != is_active:
+        adjust_active_orders(1 if is_active else -1)
+    return old_status
+
+
+@app.route("/update_order_status", methods=["POST"])
+def update_order_status():
+    """Kitchen staff (admin) moves an order through Pending -> Preparing -> Ready -> Delivered"""
+    if session.get('username') != 'admin':
+        return jsonify({'success': False, 'message': 'Not authorized'}), 403
+
+    data = request.get_json(silent=True) or {}
+    order_id = data.get('order_id')
+    status = data.get('status')
+
+    # bool is an int subclass, and lists/dicts would otherwise be accepted by session.get()
+    if not isinstance(order_id, int) or isinstance(order_id, bool) or order_id <= 0 \
+            or status not in ORDER_STATUSES:
+        return jsonify({'success': False, 'message': 'Invalid order or status'}), 400
+
+    try:
+        old_status = run_write(set_order_status, order_id, status)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error("Database error updating order status: %s", e)
+        return jsonify({'success': False, 'message': 'Failed to update order.'}), 500
+
+    if old_status is None:
+        return jsonify({'success': False, 'message': 'Order not found'}), 404
+
+    kitchen.record_status_change(old_status, status)
+    return jsonify({'success': True, 'order_id': order_id, 'status': status})
+
+
 @app.route("/contact", methods=["GET", "POST"])
 def contact():
     if request.method == "POST":
@@ -727,13 +1349,13 @@ def contact():
                     server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
                     server.send_message(msg)
 
-                logger.info(f"Contact form submission from {email}")
+                logger.info("Contact form submission from %s", email)
                 flash('Thank you for contacting us! We will get back to you soon.', 'success')
             else:
                 flash('Message received! We will respond shortly.', 'success')
 
         except Exception as e:
-            logger.error(f"Contact form email error: {e}")
+            logger.error("Contact form email error: %s", e)
             flash('Message received! We will respond shortly.', 'success')
 
         return render_template("contact.html")
@@ -748,12 +1370,275 @@ def page_not_found(e):
 
 @app.errorhandler(500)
 def internal_server_error(e):
-    logger.error(f"Internal server error: {e}")
+    logger.error("Internal server error: %s", e)
     return render_template('500.html'), 500
 
 
+# ===== PROFILING =====
+# Off by default: with PROFILING_ENABLED unset no hooks or threads are installed at all
+PROFILING_CONFIG = {
+    'enabled': os.getenv('PROFILING_ENABLED', 'false').lower() == 'true',
+    'token': os.getenv('PROFILING_TOKEN', ''),
+    'dir': os.path.abspath(os.getenv('PROFILE_DIR', 'profiles')),
+    'poll_seconds': float(os.getenv('PROFILING_POLL_SECONDS', '1'))
+}
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """Render a frame and its callers as a collapsed-stack line (root first)"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def write_collapsed(path, stacks):
+    """Write {stack: weight} in the collapsed format read by flamegraph.pl and speedscope"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        for stack, weight in stacks.items():
+            f.write(f"{stack} {int(weight)}\n")
+
+
+class RequestProfiler:
+    """Deterministic profiler for a single request, timing every call stack in microseconds"""
+
+    def __init__(self):
+        self.stacks = Counter()
+        self._stack = [()]
+        self._last = None
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter()
+        current = self._stack[-1]
+        if current:
+            self.stacks[current] += now - self._last
+        self._last = now
+
+        if event == 'call':
+            self._stack.append(current + (frame_label(frame.f_code),))
+        elif event == 'c_call':
+            self._stack.append(current + (f"{getattr(arg, '__qualname__', arg)} (builtin)",))
+        elif len(self._stack) > 1:  # return, c_return, c_exception
+            self._stack.pop()
+
+    def start(self):
+        self._last = time.perf_counter()
+        sys.setprofile(self._callback)
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def collapsed(self):
+        return {';'.join(stack): seconds * 1e6 for stack, seconds in self.stacks.items()}
+
+
+class SamplingProfiler:
+    """Low-overhead statistical profiler shared by every worker through a control file.
+
+    Each worker polls PROFILE_DIR/sampling.json; while a session is active it samples
+    the stacks of threads that are serving requests and, when the window ends,
+    writes sampling-<session>-<pid>.collapsed for the admin endpoint to merge.
+    """
+
+    def __init__(self, directory, poll_seconds=1):
+        self.control_path = os.path.join(directory, 'sampling.json')
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self.request_threads = set()
+        self.control = {}
+        self._control_mtime = None
+        self._sampling_session = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, session_id, seconds, interval):
+        """Start (seconds > 0) or stop (seconds = 0) sampling on all workers"""
+        os.makedirs(self.directory, exist_ok=True)
+        control = {'session': session_id, 'until': time.time() + seconds, 'interval': interval}
+        tmp_path = f"{self.control_path}.{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(control, f)
+        os.replace(tmp_path, self.control_path)
+
+    def _read_control(self):
+        try:
+            mtime = os.stat(self.control_path).st_mtime
+        except FileNotFoundError:
+            self.control = {}
+            return
+        if mtime != self._control_mtime:
+            self._control_mtime = mtime
+            try:
+                with open(self.control_path) as f:
+                    self.control = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not read profiling control file: %s", e)
+
+    def _run(self):
+        while True:
+            self._read_control()
+            session_id = self.control.get('session')
+            if session_id and session_id != self._sampling_session and self.control.get('until', 0) > time.time():
+                self._sample(session_id)
+            time.sleep(self.poll_seconds)
+
+    def _sample(self, session_id):
+        self._sampling_session = session_id
+        interval = self.control.get('interval', 0.005)
+        stacks = Counter()
+        logger.info("Sampling profiler session %s started", session_id)
+
+        while self.control.get('session') == session_id and time.time() < self.control.get('until', 0):
+            frames = sys._current_frames()
+            for ident in list(self.request_threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[collapse_stack(frame)] += 1
+            time.sleep(interval)
+            self._read_control()
+
+        write_collapsed(os.path.join(self.directory, f"sampling-{session_id}-{os.getpid()}.collapsed"), stacks)
+        logger.info("Sampling profiler session %s finished with %s samples", session_id, sum(stacks.values()))
+
+    def ensure_started(self):
+        # Restart after fork (e.g. gunicorn workers) - threads don't survive it
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self.request_threads = set()
+                self._thread = threading.Thread(target=self._run, name='profiling-control', daemon=True)
+                self._thread.start()
+
+
+sampling_profiler = SamplingProfiler(PROFILING_CONFIG['dir'], PROFILING_CONFIG['poll_seconds'])
+
+
+def is_profiling_authorized():
+    """Admins, or anyone presenting PROFILING_TOKEN in the X-Profile-Token header.
+
+    The token is deliberately not accepted as a query parameter, where it would
+    end up in access logs.
+    """
+    if not PROFILING_CONFIG['enabled']:
+        return False
+    if session.get('username') == 'admin':
+        return True
+    token = request.headers.get('X-Profile-Token', '')
+    return bool(PROFILING_CONFIG['token']) and hmac.compare_digest(token, PROFILING_CONFIG['token'])
+
+
+def start_request_profiling():
+    sampling_profiler.ensure_started()
+    sampling_profiler.request_threads.add(threading.get_ident())
+
+    wants_profile = request.headers.get('X-Profile') == '1' or 'profile' in request.args
+    if wants_profile and is_profiling_authorized():
+        g.profiler = RequestProfiler()
+        g.profiler.start()
+
+
+def finish_request_profiling(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        # request_id can come from the client's X-Request-ID, so keep only safe filename characters
+        request_id = re.sub(r'[^A-Za-z0-9_-]', '', g.get('request_id', '')) or uuid.uuid4().hex
+        endpoint = re.sub(r'[^A-Za-z0-9_-]', '', request.endpoint or 'unknown')
+        name = f"request-{int(time.time())}-{endpoint}-{request_id}.collapsed"
+        write_collapsed(os.path.join(PROFILING_CONFIG['dir'], name), profiler.collapsed())
+        response.headers['X-Profile-Artifact'] = name
+        logger.info("Request profile written to %s", name)
+    return response
+
+
+def end_request_profiling(exc):
+    sampling_profiler.request_threads.discard(threading.get_ident())
+    profiler = g.pop('profiler', None)
+    if profiler is not None:  # view raised before after_request ran
+        profiler.stop()
+
+
+if PROFILING_CONFIG['enabled']:
+    app.before_request(start_request_profiling)
+    app.after_request(finish_request_profiling)
+    app.teardown_request(end_request_profiling)
+
+
+@app.route("/admin/profiling/sampling", methods=["POST"])
+def control_sampling():
+    """Start or stop the sampling profiler on every worker"""
+    if not is_profiling_authorized():
+        abort(404)
+
+    data = request.get_json(silent=True) or {}
+    action = data.get('action', 'start')
+    if action not in ('start', 'stop'):
+        return jsonify({'success': False, 'message': 'action must be start or stop'}), 400
+
+    try:
+        seconds = min(float(data.get('seconds', 30)), 600) if action == 'start' else 0
+        interval = max(float(data.get('interval_ms', 5)), 1) / 1000
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid seconds or interval_ms'}), 400
+
+    session_id = sampling_profiler.control.get('session') if action == 'stop' else None
+    session_id = session_id or uuid.uuid4().hex[:12]
+    sampling_profiler.configure(session_id, seconds, interval)
+    return jsonify({'success': True, 'session': session_id, 'seconds': seconds})
+
+
+@app.route("/admin/profiling/sampling/<session_id>")
+def sampling_results(session_id):
+    """Merge every worker's samples for a session into one collapsed-stack file"""
+    if not is_profiling_authorized():
+        abort(404)
+    if not re.fullmatch(r'[0-9a-f]{12}', session_id):
+        abort(404)
+
+    prefix = f"sampling-{session_id}-"
+    stacks = Counter()
+    for name in os.listdir(PROFILING_CONFIG['dir']) if os.path.isdir(PROFILING_CONFIG['dir']) else []:
+        if name.startswith(prefix) and name.endswith('.collapsed'):
+            with open(os.path.join(PROFILING_CONFIG['dir'], name)) as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    stacks[stack] += int(count)
+
+    body = ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    return app.response_class(body, mimetype='text/plain')
+
+
+@app.route("/admin/profiling/artifacts/<name>")
+def profiling_artifact(name):
+    """Download a per-request profile named in an X-Profile-Artifact header"""
+    if not is_profiling_authorized():
+        abort(404)
+    return send_from_directory(PROFILING_CONFIG['dir'], name, mimetype='text/plain')
+
+
 # ===== APPLICATION ENTRY POINT =====
+def drop_inherited_sqlite_connections():
+    """SQLite connections must not be used across fork() (e.g. gunicorn --preload).
+
+    close=False leaves the parent's handles alone; the child simply opens its own.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
 with app.app_context():
+    if IS_SQLITE:
+        event.listen(db.engine, 'connect', set_sqlite_pragmas)
+        os.register_at_fork(after_in_child=drop_inherited_sqlite_connections)
     check_and_create_tables()
 
 app = app
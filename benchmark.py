@@ -0,0 +1,107 @@
+"""Benchmark /login and /place_order against different database backends.
+
+Usage:
+    python benchmark.py                                   # embedded SQLite only
+    BENCH_POSTGRES_URL=postgresql://... python benchmark.py  # SQLite vs local Postgres
+
+SQLite is also run with logging disabled to show what logging costs per request.
+
+Each backend runs in its own process because app.py configures the database
+at import time. Requests go through Flask's test client, so the numbers are
+server-side latency without any HTTP overhead. Email is disabled.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ITERATIONS = int(os.getenv('BENCH_ITERATIONS', '200'))
+CART = [
+    {'name': 'Cappuccino', 'quantity': 2, 'price': 150},
+    {'name': 'Margerita Pizza', 'quantity': 1, 'price': 299}
+]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1] * 1000, 3)
+    }
+
+
+def run_worker():
+    """Runs inside the child process with the backend already set in the environment"""
+    from app import app, db, Signup
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+
+    username = f"bench_{os.getpid()}_{int(time.time())}"
+    with app.app_context():
+        user = Signup(username=username, email=f"{username}@urbanbrew.test")
+        user.password = 'bench-password'
+        db.session.add(user)
+        db.session.commit()
+
+    results = {}
+
+    login_times = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        client.post('/login', data={'username': username, 'password': 'bench-password'})
+        login_times.append(time.perf_counter() - start)
+    results['/login'] = summarize(login_times)
+
+    order_times = []
+    payload = {'cart_items': CART, 'total_amount': 599, 'address': '12 Station Road, Anand'}
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        response = client.post('/place_order', json=payload)
+        order_times.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"/place_order failed: {response.get_json()}")
+    results['/place_order'] = summarize(order_times)
+
+    print(json.dumps(results))
+
+
+def run_backend(name, env):
+    child_env = {k: v for k, v in os.environ.items() if k not in ('DATABASE_URL', 'SQLITE_PATH')}
+    child_env.update(EMAIL_USER='', EMAIL_PASSWORD='', LOGGING_ENABLED='true')
+    child_env.update(env)
+    output = subprocess.run(
+        [sys.executable, __file__, '--worker'],
+        env=child_env, capture_output=True, text=True, check=True
+    ).stdout
+    results = json.loads(output.strip().splitlines()[-1])
+    for route, stats in results.items():
+        print(f"{name:<22} {route:<14} mean {stats['mean_ms']:>8} ms   "
+              f"p50 {stats['p50_ms']:>8} ms   p95 {stats['p95_ms']:>8} ms")
+
+
+def main():
+    print(f"{ITERATIONS} iterations per route\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        run_backend('sqlite', {'SQLITE_PATH': os.path.join(tmp, 'bench.db')})
+        run_backend('sqlite (logging off)', {
+            'SQLITE_PATH': os.path.join(tmp, 'bench_nolog.db'),
+            'LOGGING_ENABLED': 'false'
+        })
+
+    postgres_url = os.getenv('BENCH_POSTGRES_URL')
+    if postgres_url:
+        run_backend('postgres', {'DATABASE_URL': postgres_url})
+    else:
+        print("\nBENCH_POSTGRES_URL not set - skipping Postgres")
+
+
+if __name__ == '__main__':
+    if '--worker' in sys.argv:
+        run_worker()
+    else:
+        main()
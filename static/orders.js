@@ -239,7 +239,7 @@ async function confirmOrder() {
         
         if (result.success) {
             // Success message
-            alert(`✅ ${result.message}\n\nOrder ID: #${result.order_id}\n\nA confirmation email has been sent to your registered email address.\n\nEstimated delivery: 30-40 minutes`);
+            alert(`✅ ${result.message}\n\nOrder ID: #${result.order_id}\n\nA confirmation email has been sent to your registered email address.\n\nEstimated delivery: ${result.eta_text || '30-40 minutes'}`);
             
             // Clear cart
             cart = [];